@@ -1,7 +1,16 @@
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
 import requests
 import zipfile
+import csv
+import tempfile
 import io
+import os
+import hashlib
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 
 gios_archive_url = "https://powietrze.gios.gov.pl/pjp/archives/downloadFile/"
 
@@ -18,23 +27,68 @@ def download_gios_archive(year, gios_id, filename):
         pandas.DataFrame: Dane PM2.5 wczytane z pliku Excel.
     """
     
-    # Pobranie archiwum ZIP do pamięci
+    # Pobranie archiwum ZIP strumieniowo - kolejne fragmenty trafiają od razu do bufora
+    # (w pamięci do 32 MB, powyżej na dysku), bez drugiej kopii całego archiwum w pamięci
+    # (połączenie i bufor zamykane również przy błędzie w trakcie pobierania)
     url = f"{gios_archive_url}{gios_id}"
-    response = requests.get(url)
-    response.raise_for_status()  # jeśli błąd HTTP, zatrzymaj
+    with tempfile.SpooledTemporaryFile(max_size=32 << 20) as spool:
+        with requests.get(url, stream=True) as response:
+            response.raise_for_status()  # jeśli błąd HTTP, zatrzymaj
+            for chunk in response.iter_content(chunk_size=1 << 20):
+                spool.write(chunk)
+        spool.seek(0)
+
+        # Otwórz zip z bufora
+        with zipfile.ZipFile(spool) as z:
+            # znajdź właściwy plik z PM2.5
+            if not filename:
+                print(f"Błąd: nie znaleziono {filename}.")
+            else:
+                # wczytaj plik do pandas (calamine - parser xlsx w Ruście, wielokrotnie szybszy od openpyxl)
+                with z.open(filename) as f:
+                    try:
+                        df = pd.read_excel(f, header=None, engine="calamine")
+                    except Exception as e:
+                        print(f"Błąd przy wczytywaniu {year}: {e}")
+    return df
 
-    # Otwórz zip w pamięci
-    with zipfile.ZipFile(io.BytesIO(response.content)) as z:
-        # znajdź właściwy plik z PM2.5
-        if not filename:
-            print(f"Błąd: nie znaleziono {filename}.")
-        else:
-            # wczytaj plik do pandas
-            with z.open(filename) as f:
-                try:
-                    df = pd.read_excel(f, header=None)
-                except Exception as e:
-                    print(f"Błąd przy wczytywaniu {year}: {e}")
+
+def cached_gios_archive(year, gios_id, filename, cache_dir=None):
+    """
+    Zwraca dane z archiwum GIOŚ, korzystając z lokalnej kopii na dysku, jeśli istnieje.
+
+    Args:
+        year (int): Rok danych.
+        gios_id (str): Identyfikator archiwum GIOŚ.
+        filename (str): Nazwa pliku Excel w archiwum ZIP.
+        cache_dir (str | pathlib.Path | None): Katalog z kopiami pobranych danych;
+            None oznacza pobieranie bez cache.
+
+    Returns:
+        pandas.DataFrame: Dane PM2.5 wczytane z pliku Excel (lub z kopii na dysku).
+    """
+
+    if cache_dir is None:
+        return download_gios_archive(year, gios_id, filename)
+
+    # klucz na podstawie adresu i nazwy pliku; pickle, bo surowy arkusz ma kolumny mieszanego typu
+    key = hashlib.blake2b(f"{gios_archive_url}{gios_id}/{filename}".encode()).hexdigest()[:16]
+    path = Path(cache_dir) / f"{key}.pkl"
+    if path.exists():
+        return pd.read_pickle(path)
+
+    df = download_gios_archive(year, gios_id, filename)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    # zapis do pliku tymczasowego i podmiana - przerwany zapis nie zostawia w cache
+    # uszkodzonego pliku .pkl, który przy kolejnych uruchomieniach byłby brany za poprawny
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    os.close(fd)
+    try:
+        df.to_pickle(tmp)
+        os.replace(tmp, path)
+    finally:
+        Path(tmp).unlink(missing_ok=True)
     return df
 
 
@@ -56,7 +110,7 @@ def download_gios_meta(gios_id):
     response.raise_for_status()  # jeśli błąd HTTP, zatrzymaj
 
     # wczytaj plik do pandas
-    df = pd.read_excel(io.BytesIO(response.content))
+    df = pd.read_excel(io.BytesIO(response.content), engine="calamine")
     return df
 
 
@@ -79,7 +133,16 @@ def clean_pm25(df, header_row, drop_rows):
 
     first = df.columns[0]
     df = df.rename(columns={first: "datetime"})
-    df["datetime"] = pd.to_datetime(df["datetime"])
+    # jawny format ISO8601 - parser C bez zgadywania formatu (akceptuje też komórki typu datetime)
+    df["datetime"] = pd.to_datetime(df["datetime"], format="ISO8601")
+
+    # kolumny stacji w całości liczbowe -> float32 (wystarczająca precyzja dla PM2.5, o połowę mniej pamięci);
+    # kolumny z tekstem (np. "12,5") zostają bez zmian i są czyszczone dopiero w stats.convert_df
+    for col in df.columns[1:]:
+        try:
+            df[col] = pd.to_numeric(df[col], downcast="float")
+        except (ValueError, TypeError):
+            pass
     return df
 
 
@@ -93,12 +156,11 @@ def midnight(df):
     Returns:
         pandas.DataFrame: Dane z przesuniętą godziną 00:00:00 o jedną sekundę wstecz.
     """
-    df = df.copy()
-    # checking if hrs, mins, secs = 0 (True/False, where True means midnight)
-    midn = (df["datetime"].dt.hour.eq(0)) & (df["datetime"].dt.minute.eq(0)) & (df["datetime"].dt.second.eq(0))
-    # if True (midnight) -> taking back 1 second in "datetime" column 
-    df.loc[midn, "datetime"] = df.loc[midn, "datetime"] - pd.Timedelta(seconds=1) 
-    return df
+    dt = df["datetime"].to_numpy()
+    # checking if hrs, mins, secs = 0 (time since start of the day below 1 s, where True means midnight)
+    midn = (dt - dt.astype("datetime64[D]")) < np.timedelta64(1, "s")
+    # if True (midnight) -> taking back 1 second; assign returns a new frame, input stays untouched
+    return df.assign(datetime=np.where(midn, dt - np.timedelta64(1, "s"), dt))
 
 
 def update_stations(df, meta):
@@ -114,23 +176,20 @@ def update_stations(df, meta):
     """
 
 
-    df = df.copy()
     old_code = 'Stary Kod stacji \n(o ile inny od aktualnego)'
     new_code = 'Kod stacji'
 
-    # creating a dictionary with code mapping (old: new)
-    mapping_codes = {}
-    for old, new in zip(meta[old_code], meta[new_code]):
-        if pd.isna(old):
-            continue
-
-        # handling examples with multiple old station codes    
-        multiple_codes = [codes.strip() for codes in str(old).split(",") if codes.strip()] 
-        
-        for old in multiple_codes:
-            mapping_codes[old] = new
-    df = df.rename(columns=mapping_codes)
-    return df
+    # creating a dictionary with code mapping (old: new), skipping empty (NaN) old codes;
+    # handling examples with multiple old station codes separated by commas
+    mapping_codes = {
+        code.strip(): new
+        for old, new in zip(meta[old_code], meta[new_code])
+        if isinstance(old, str)
+        for code in old.split(",")
+        if code.strip()
+    }
+    # a single rename of column labels - returns a new frame, no data is touched
+    return df.rename(columns=mapping_codes)
 
 
 def add_city(df, meta):
@@ -146,24 +205,64 @@ def add_city(df, meta):
     """
 
 
-    df = df.copy()
-    city = (
-        meta[["Kod stacji", "Miejscowość"]]
-        .dropna(subset=["Kod stacji"])
-        .drop_duplicates(subset=["Kod stacji"])
-        .set_index("Kod stacji")["Miejscowość"]
-    )
+    # słownik kod stacji -> miejscowość (pierwsze wystąpienie kodu w metadanych)
+    city = {}
+    for code, name in zip(meta["Kod stacji"], meta["Miejscowość"]):
+        if pd.notna(code):
+            city.setdefault(code, name)
+
     station_codes = [x for x in df.columns if x != "datetime"]
-    cities = city.reindex(station_codes).fillna("Unknown")
+    cities = [city.get(code) for code in station_codes]
+    cities = [name if pd.notna(name) else "Unknown" for name in cities]
 
-    df.columns = pd.MultiIndex.from_tuples(
-        [("datetime", "")] + list(zip(cities, station_codes)),
+    # nowe nagłówki kolumn bez kopiowania danych (set_axis zwraca nowy DataFrame)
+    columns = pd.MultiIndex.from_arrays(
+        [["datetime"] + cities, [""] + station_codes],
         names=["Miejscowość", "Kod stacji"]
     )
-    return df
+    return df.set_axis(columns, axis=1)
+
+
+def save_pm25(df, outfile):
+    """
+    Zapisuje dane PM2.5 do pliku Parquet (rozszerzenie .parquet) lub CSV (pozostałe).
+
+    Args:
+        df (pandas.DataFrame): Dane PM2.5 z kolumnami w formacie MultiIndex (miasto, stacja).
+        outfile (str): Nazwa pliku wyjściowego.
+
+    Returns:
+        None
+    """
+
+    # pyarrow wymaga jednego typu w kolumnie - kolumny object (liczby przemieszane
+    # z tekstem, np. "12,5") zapisywane są jako tekst
+    mixed = df.columns[df.dtypes == object]
+    df = df.astype({c: "str" for c in mixed})
+
+    if str(outfile).endswith(".parquet"):
+        df.to_parquet(outfile, engine="pyarrow", compression="zstd")
+        return
+
+    # CSV: dwa wiersze nagłówka (miasto, stacja) jak w DataFrame.to_csv, a dane zapisuje
+    # wielowątkowy writer CSV z pyarrow (kilkukrotnie szybszy od to_csv)
+    with open(outfile, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f, lineterminator="\n")  # "\n" jak w wierszach danych z pyarrow
+        for level in range(df.columns.nlevels):
+            writer.writerow(df.columns.get_level_values(level))
+
+    table = pa.Table.from_arrays(
+        [pa.array(df.iloc[:, i]) for i in range(df.shape[1])],
+        names=[str(i) for i in range(df.shape[1])],
+    )
+    with open(outfile, "ab") as f:
+        pa_csv.write_csv(
+            table, f,
+            write_options=pa_csv.WriteOptions(include_header=False, quoting_style="needed"),
+        )
 
 
-def make_pm25_data(years, gios_url_ids, gios_pm25_file, clean_info, outfile):
+def make_pm25_data(years, gios_url_ids, gios_pm25_file, clean_info, outfile, cache_dir=None):
     """
     Wykonuje pełny pipeline przetwarzania danych PM2.5.
 
@@ -172,16 +271,24 @@ def make_pm25_data(years, gios_url_ids, gios_pm25_file, clean_info, outfile):
         gios_url_ids (dict): Identyfikatory archiwów i metadanych GIOŚ.
         gios_pm25_file (dict): Nazwy plików PM2.5 dla poszczególnych lat.
         clean_info (dict): Parametry czyszczenia danych.
-        outfile (str): Nazwa pliku wyjściowego CSV.
+        outfile (str): Nazwa pliku wyjściowego (.parquet - Parquet, w pozostałych przypadkach CSV).
+        cache_dir (str | pathlib.Path | None): Katalog z kopiami pobranych archiwów
+            (patrz cached_gios_archive); domyślnie bez cache.
 
     Returns:
         tuple: DataFrame z danymi PM2.5 oraz DataFrame z metadanymi.
     """
 
 
-    # downloading
-    data = {y: download_gios_archive(y, gios_url_ids[y], gios_pm25_file[y]) for y in years}
-    meta = download_gios_meta(gios_url_ids["meta"])
+    # downloading - archiwa z kolejnych lat pobierane równolegle (praca sieciowa, GIL zwalniany)
+    with ThreadPoolExecutor(max_workers=min(8, len(years) + 1)) as ex:
+        futures = {
+            y: ex.submit(cached_gios_archive, y, gios_url_ids[y], gios_pm25_file[y], cache_dir)
+            for y in years
+        }
+        meta_future = ex.submit(download_gios_meta, gios_url_ids["meta"])
+        data = {y: f.result() for y, f in futures.items()}
+        meta = meta_future.result()
 
     # cleaning 
     cleaned = {
@@ -207,5 +314,5 @@ def make_pm25_data(years, gios_url_ids, gios_pm25_file, clean_info, outfile):
     # adding cities (MultiIndex)
     df_pm25 = add_city(df_pm25, meta)
 
-    df_pm25.to_csv(outfile, index=None)
+    save_pm25(df_pm25, outfile)
     return df_pm25, meta
\ No newline at end of file
@@ -1,3 +1,12 @@
+import os
+import matplotlib
+
+# PM25_HEADLESS=1 (np. w CI lub przy zapisie wykresów do plików) wybiera backend Agg,
+# dzięki czemu tworzenie figur nie inicjalizuje GUI; inne wartości (np. 0) nie zmieniają backendu
+if os.environ.get("PM25_HEADLESS", "").strip().lower() in {"1", "true", "yes"}:
+    matplotlib.use("Agg")
+
+import numpy as np
 import seaborn as sns
 import pandas as pd
 import matplotlib.pyplot as plt
@@ -14,34 +23,28 @@ def plot_means(monthly_means, cities, years):
     Returns:
         None: Funkcja wyświetla wykres.
     """
-    # filtrowanie danych do wybranych miast oraz liczenie średniej miesięcznej dla miasta
+    # filtrowanie danych do wybranych miast i lat oraz liczenie średniej miesięcznej dla miasta
+    selected = monthly_means[
+        monthly_means["Miejscowość"].isin(cities) & monthly_means["Rok"].isin(years)
+    ]
     city_monthly = (
-        monthly_means[monthly_means["Miejscowość"].isin(cities)]
-        .groupby(["Rok", "Miesiąc", "Miejscowość"])["Mean PM25"]
-        .mean()
-        .reset_index()
+        selected.groupby(["Miesiąc", "Miejscowość", "Rok"], observed=True)["Mean PM25"].mean()
     )
 
-    # ;pivot danych tak żeby łatwiej było stworzyć wykres
-    df = city_monthly[city_monthly["Rok"].isin(years)]
-    df = df.pivot_table(
-        values="Mean PM25",
-        index="Miesiąc",
-        columns=["Miejscowość", "Rok"]
-    )
+    # miesiące w wierszach, (miasto, rok) w kolumnach - unstack wyniku groupby zamiast pivot_table
+    df = city_monthly.unstack(["Miejscowość", "Rok"])
 
-    plt.figure()
-    for city in cities:
-        for year in years:
-            plt.plot(df.index, df[(city, year)], label=f"{city} {year}")
-
-    plt.legend()
-    plt.xlabel("Miesiąc")
-    plt.ylabel("Średnia miesięczna wartość PM25")
-    plt.title(
+    # kolejność linii jak w argumentach: miasto -> rok
+    df = df.reindex(columns=pd.MultiIndex.from_product([cities, years]))
+
+    # jedno wywołanie rysujące wszystkie linie naraz
+    ax = df.plot(grid=True)
+    ax.legend(df.columns.map(lambda c: f"{c[0]} {c[1]}"))
+    ax.set_xlabel("Miesiąc")
+    ax.set_ylabel("Średnia miesięczna wartość PM25")
+    ax.set_title(
         f"Trend średnich miesięcznych PM2.5 w Warszawie i Katowicach w latach {years[0]} i {years[1]}"
     )
-    plt.grid(True)
     plt.show()
 
 
@@ -68,27 +71,42 @@ def heatmaps_means(city_monthly, years):
     cities = df["Miejscowość"].unique()
     vmin, vmax = df["Mean PM25"].min(), df["Mean PM25"].max()
 
-    # siatka wykresów i dla każdego miasta heatmapa
-    fig, axes = plt.subplots(6, 3, figsize=(18, 36))
+    months = list(range(1, 13))
+
+    # siatka wykresów i dla każdego miasta heatmapa; stały układ (rozmiar figury jest stały),
+    # więc przy rysowaniu nie trzeba przeliczać układu dla każdego z 18 wykresów
+    fig, axes = plt.subplots(
+        6, 3, figsize=(18, 36),
+        gridspec_kw={"left": 0.05, "right": 0.9, "bottom": 0.03, "top": 0.98, "wspace": 0.25, "hspace": 0.2},
+    )
     axes = axes.flatten()
 
-    for ax, city in zip(axes, cities):
-        data = df[df["Miejscowość"] == city]
-        pivot = data.pivot(index="Rok", columns="Miesiąc", values="Mean PM25")
-        pivot = pivot.reindex(years)
-        hm = sns.heatmap(pivot, vmin=vmin, vmax=vmax, ax=ax)
+    # jedno grupowanie dla wszystkich miast -> tablica (miasto, rok, miesiąc)
+    grid = (
+        df.groupby(["Miejscowość", "Rok", "Miesiąc"], observed=True)["Mean PM25"].mean()
+        .unstack("Miesiąc")
+        .reindex(index=pd.MultiIndex.from_product([cities, years]), columns=months)
+    )
+    values = grid.to_numpy(dtype=np.float32).reshape(len(cities), len(years), len(months))
+
+    for ax, city, mat in zip(axes, cities, values):
+        # imshow na gotowej macierzy - wspólna skala kolorów, bez osobnego colorbara dla każdego miasta
+        im = ax.imshow(mat, vmin=vmin, vmax=vmax, aspect="auto", cmap="rocket")
 
+        ax.set_xticks(range(len(months)), labels=months)
+        ax.set_yticks(range(len(years)), labels=years)
         ax.set_title(city, fontsize=16)
         ax.set_xlabel("Miesiąc", fontsize=16)
         ax.set_ylabel("Rok", fontsize=14)
 
-        cbar = hm.collections[0].colorbar
-        cbar.set_label("PM2.5 [ug/m3]", fontsize=12)
-
     for ax in axes[len(cities):]:
         ax.axis("off")
 
-    plt.tight_layout()
+    # jeden colorbar dla wszystkich heatmap (bez danych dla wybranych lat - pusta figura)
+    if len(cities):
+        cbar = fig.colorbar(im, cax=fig.add_axes([0.92, 0.35, 0.015, 0.3]))
+        cbar.set_label("PM2.5 [ug/m3]", fontsize=12)
+
     return fig
 
 
@@ -112,7 +130,8 @@ def plot_overnorm(over_counts, selected, years):
     y_col = df.columns[-1]
 
     plt.figure()
-    sns.barplot(data=df, x="Kod stacji", y=y_col, hue="Rok")
+    # jawna kolejność - na osi tylko wybrane stacje (również dla Kod stacji typu category)
+    sns.barplot(data=df, x="Kod stacji", y=y_col, hue="Rok", order=df["Kod stacji"].unique())
     plt.title("Liczba dni z przekroczeniem normy dobowej PM2.5")
     plt.xlabel("Stacja")
     plt.ylabel("Liczba dni z przekroczeniem")
@@ -134,37 +153,30 @@ def plot_wojewodztwa(df: pd.DataFrame, year: int = 2024, treshold: int = 15):
         None: Funkcja wyświetla wykres.
     """
 
-    sns.set_theme(style="whitegrid", context="talk")
-
     df = df.sort_values(ascending=False)
-   
+
     df = df.reset_index()
     df.columns = ["name", "value"]
 
-    fig, ax = plt.subplots(figsize=(16, 10))
+    # styl "whitegrid"/"talk" tylko dla tego wykresu - bez zmiany globalnych rcParams
+    with sns.plotting_context("talk"), sns.axes_style("whitegrid"):
+        fig, ax = plt.subplots(figsize=(16, 10))
 
-    sns.barplot(
-        data=df,
-        x="name",
-        y="value",
-        hue="name",
-        palette='magma',
-        ax=ax,
-    )
+        # jeden zestaw słupków z kolorami z palety magma (bez grupowania hue w seaborn)
+        colors = matplotlib.colormaps["magma"](np.linspace(0.1, 0.9, len(df)))
+        bars = ax.bar(df["name"].astype(str), df["value"], color=colors)
 
-    ax.set_title(f"Liczba dni z przekroczeniem normy stężenia PM2.5 w roku {year} w poszczególnych województwach")
+        ax.set_title(f"Liczba dni z przekroczeniem normy stężenia PM2.5 w roku {year} w poszczególnych województwach")
 
-    # Rotate long labels
-    ax.set_xticklabels(ax.get_xticklabels(), rotation=30, ha="right")
+        # Rotate long labels
+        plt.setp(ax.get_xticklabels(), rotation=30, ha="right")
 
-    # Add value labels on top of bars
-    for container in ax.containers:
-        # ax.bar_label(container, fmt="%.2f", padding=3)
-        ax.bar_label(container, padding=3)
+        # Add value labels on top of bars
+        ax.bar_label(bars, padding=3)
 
-    # Labels and legend
-    ax.set_xlabel("")
-    ax.set_ylabel(f"Liczba dni z przekroczeniem progu {treshold} µg/m³")
+        # Labels and legend
+        ax.set_xlabel("")
+        ax.set_ylabel(f"Liczba dni z przekroczeniem progu {treshold} µg/m³")
 
-    plt.tight_layout()
-    plt.show()
\ No newline at end of file
+        plt.tight_layout()
+        plt.show()
\ No newline at end of file
@@ -1,31 +1,119 @@
+import functools
+
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 
-def convert_df(df_pm25):
+
+@functools.cache
+def _jit(func):
     """
-    Przekształca dane PM2.5 z formatu szerokiego na długi i czyści wartości liczbowe.
+    Kompiluje funkcję numbą przy pierwszym użyciu (numba jest potrzebna tylko dla engine="numba").
 
     Args:
-        df_pm25 (pandas.DataFrame): Dane PM2.5 w formacie szerokim z MultiIndex.
+        func (callable): Funkcja operująca na tablicach NumPy.
 
     Returns:
-        pandas.DataFrame: Dane w formacie długim z kolumnami datetime, Miejscowość, Kod stacji i PM25.
+        callable: Skompilowana funkcja.
     """
+    try:
+        import numba
+    except ImportError as e:
+        raise ImportError("engine='numba' wymaga zainstalowanego pakietu numba") from e
+    return numba.njit(cache=True)(func)
 
-    df = df_pm25.copy()
 
-    formated = (
-        df
-        .set_index(("datetime", ""))
-        .stack(["Miejscowość", "Kod stacji"])
-        .reset_index()
-    )
+def _split_datetime(dt):
+    """
+    Wyznacza rok, miesiąc i dzień z kolumny datetime (jednokrotnie, bez obiektów datetime.date).
 
-    formated.columns = ["datetime", "Miejscowość", "Kod stacji", "PM25"]
-    formated["PM25"] = (
-        formated["PM25"].astype(str).str.strip()
-        .str.replace(",", ".", regex=False)
+    Args:
+        dt (pandas.Series): Kolumna datetime.
+
+    Returns:
+        tuple: Serie Rok (int16), Miesiąc (int8) i Dzień (datetime64 o północy).
+    """
+    return (
+        dt.dt.year.astype("int16").rename("Rok"),
+        dt.dt.month.astype("int8").rename("Miesiąc"),
+        dt.dt.normalize().rename("Dzień"),
     )
-    formated["PM25"] = pd.to_numeric(formated["PM25"], errors="coerce")
+
+
+def _time_keys(formated):
+    """
+    Zwraca kolumny Rok, Miesiąc i Dzień - gotowe z convert_df lub wyliczone z datetime.
+
+    Args:
+        formated (pandas.DataFrame): Dane PM2.5 w formacie długim.
+
+    Returns:
+        tuple: Serie Rok, Miesiąc i Dzień.
+    """
+    if {"Rok", "Miesiąc", "Dzień"}.issubset(formated.columns):
+        return formated["Rok"], formated["Miesiąc"], formated["Dzień"]
+    return _split_datetime(formated["datetime"])
+
+
+def convert_df(df_pm25):
+    """
+    Przekształca dane PM2.5 z formatu szerokiego na długi i czyści wartości liczbowe.
+
+    Args:
+        df_pm25 (pandas.DataFrame): Dane PM2.5 w formacie szerokim z MultiIndex.
+
+    Returns:
+        pandas.DataFrame: Dane w formacie długim z kolumnami datetime, Miejscowość, Kod stacji, PM25
+            oraz Rok, Miesiąc i Dzień (liczone raz, wykorzystywane przez kolejne funkcje).
+    """
+
+    stations = df_pm25.drop(columns=[("datetime", "")])
+    cities_level = stations.columns.get_level_values(0)
+    codes_level = stations.columns.get_level_values(1)
+
+    # układ wynikowy: stacje po kolei (alfabetycznie), a w obrębie stacji pomiary w kolejności czasu;
+    # sortowane są tylko wiersze i kolumny ramki szerokiej, nie cała ramka długa
+    rows = np.argsort(df_pm25[("datetime", "")].to_numpy(), kind="stable")
+    cols = np.argsort(codes_level.to_numpy(), kind="stable")
+    n_rows, n_cols = len(rows), len(cols)
+
+    city_cat = pd.Categorical(cities_level[cols])
+    code_cat = pd.Categorical(codes_level[cols])
+    values = stations.to_numpy()[np.ix_(rows, cols)]
+
+    # wszystkie tablice są świeżo zbudowane - copy=False, bez ponownego kopiowania w konstruktorze
+    formated = pd.DataFrame({
+        "datetime": np.tile(df_pm25[("datetime", "")].to_numpy()[rows], n_cols),
+        # kategorie budowane z kodów kolumn - bez faktoryzacji napisów w każdym wierszu
+        "Miejscowość": pd.Categorical.from_codes(
+            np.repeat(city_cat.codes, n_rows), dtype=city_cat.dtype
+        ),
+        "Kod stacji": pd.Categorical.from_codes(
+            np.repeat(code_cat.codes, n_rows), dtype=code_cat.dtype
+        ),
+        "PM25": values.ravel(order="F"),
+    }, copy=False)
+
+    # najpierw bezpośrednia konwersja; czyszczenie tekstu tylko dla wartości, które się nie udały
+    raw = formated["PM25"]
+    pm25 = pd.to_numeric(raw, errors="coerce")
+    failed = pm25.isna() & raw.notna()
+    if failed.any():
+        # przycięcie spacji i zamiana przecinka na kropkę w kernelach pyarrow.compute
+        cleaned = pc.replace_substring(
+            pc.utf8_trim_whitespace(pa.array(raw[failed].astype(str))),
+            pattern=",", replacement=".",
+        )
+        try:
+            pm25[failed] = pc.cast(cleaned, pa.float64()).to_numpy(zero_copy_only=False)
+        except pa.ArrowInvalid:
+            # wpisy, które nadal nie są liczbami (np. pusty tekst) -> NaN
+            pm25[failed] = pd.to_numeric(cleaned.to_pandas(), errors="coerce").to_numpy()
+    # stężenia PM2.5 (< ~1000 µg/m³) mieszczą się w float32 - o połowę mniej danych w agregacjach
+    formated["PM25"] = pm25.astype(np.float32)
+
+    formated["Rok"], formated["Miesiąc"], formated["Dzień"] = _split_datetime(formated["datetime"])
 
     return formated
 
@@ -41,15 +129,15 @@ def calc_monthly_means(formated):
         pandas.DataFrame: Średnie miesięczne PM2.5 z podziałem na rok, miesiąc, miejscowość i stację.
     """
 
-    df = formated.copy()
+    year, month, _ = _time_keys(formated)
 
     return (
-        df.groupby([
-            df["datetime"].dt.year.rename("Rok"),
-            df["datetime"].dt.month.rename("Miesiąc"),
+        formated.groupby([
+            year,
+            month,
             "Miejscowość",
             "Kod stacji"
-        ])["PM25"].mean().reset_index(name="Mean PM25")
+        ], observed=True, sort=False)["PM25"].mean().astype(np.float32).reset_index(name="Mean PM25")
     )
 
 
@@ -63,16 +151,51 @@ def calc_monthly_city_means(monthly_means):
     Returns:
         pandas.DataFrame: Średnie miesięczne PM2.5 uśrednione po wszystkich stacjach w mieście.
     """
-    df = monthly_means.copy()
-    df["Mean PM25"] = pd.to_numeric(df["Mean PM25"], errors="coerce")
+    means = pd.to_numeric(monthly_means["Mean PM25"], errors="coerce")
 
     return (
-        df.groupby(["Rok", "Miesiąc", "Miejscowość"])["Mean PM25"]
+        means.groupby([
+            monthly_means["Rok"],
+            monthly_means["Miesiąc"],
+            monthly_means["Miejscowość"]
+        ], observed=True)
         .mean()
+        .astype(np.float32)
         .reset_index()
     )
 
 
+def calc_monthly_means_and_city(formated):
+    """
+    Oblicza średnie miesięczne PM2.5 dla stacji i dla miejscowości w jednym przejściu po danych.
+
+    Args:
+        formated (pandas.DataFrame): Dane PM2.5 w formacie długim.
+
+    Returns:
+        tuple: Wynik calc_monthly_means oraz wynik calc_monthly_city_means dla tych samych danych.
+    """
+
+    year, month, _ = _time_keys(formated)
+
+    station = (
+        formated.groupby([
+            year,
+            month,
+            "Miejscowość",
+            "Kod stacji"
+        ], observed=True, sort=False)["PM25"].mean().astype(np.float32)
+    )
+    # średnie miast liczone z małego wyniku dla stacji - kolumna PM25 czytana tylko raz
+    city = (
+        station.groupby(level=["Rok", "Miesiąc", "Miejscowość"], observed=True)
+        .mean()
+        .astype(np.float32)
+    )
+
+    return station.reset_index(name="Mean PM25"), city.reset_index(name="Mean PM25")
+
+
 def calc_daily_means(formated):
     """
     Oblicza dzienne średnie stężenie PM2.5 dla każdej stacji.
@@ -83,39 +206,243 @@ def calc_daily_means(formated):
     Returns:
         pandas.DataFrame: Dzienne średnie PM2.5 z podziałem na rok, datę, miejscowość i stację.
     """
-    df = formated.copy()
-    df["PM25"] = pd.to_numeric(df["PM25"], errors="coerce")
+    pm25 = pd.to_numeric(formated["PM25"], errors="coerce")
+    year, _, day = _time_keys(formated)
 
     out = (
-        df.groupby([
-            df["datetime"].dt.year.rename("Rok"),
-            df["datetime"].dt.date.rename("Data"),
-            "Miejscowość",
-            "Kod stacji"
-        ])["PM25"]
+        pm25.groupby([
+            year,
+            day.rename("Data"),
+            formated["Miejscowość"],
+            formated["Kod stacji"]
+        ], observed=True, sort=False)
         .mean()
+        .astype(np.float32)
         .reset_index(name="Daily mean PM25")
     )
+    # daty jako datetime.date dopiero na zagregowanym (małym) wyniku
+    out["Data"] = out["Data"].dt.date
+    return out
+
+
+def _count_over_kernel(codes, vals, threshold, n_groups):
+    """
+    Zlicza wartości powyżej progu osobno dla każdej grupy (porównanie i zliczanie w jednej pętli).
+
+    Args:
+        codes (numpy.ndarray): Numer grupy dla każdego wiersza (int64, -1 = brak grupy).
+        vals (numpy.ndarray): Wartości (float32 lub float64).
+        threshold (numpy.floating): Wartość graniczna w typie `vals`.
+        n_groups (int): Liczba grup.
+
+    Returns:
+        numpy.ndarray: Liczba wartości powyżej progu w każdej grupie.
+    """
+    out = np.zeros(n_groups, dtype=np.int64)
+    for i in range(len(vals)):
+        if codes[i] >= 0 and vals[i] > threshold:
+            out[codes[i]] += 1
+    return out
+
+
+def _count_daily_overnorm_numba(daily, threshold):
+    """
+    Wersja count_overnorm_days liczona kernelem numby na tablicach NumPy.
+
+    Args:
+        daily (pandas.DataFrame): Dzienne średnie stężenia PM2.5.
+        threshold (float): Wartość graniczna normy PM2.5.
+
+    Returns:
+        pandas.DataFrame: Liczba dni z przekroczeniem normy dla każdej stacji i roku.
+    """
+    kernel = _jit(_count_over_kernel)
+
+    # numer grupy (rok, stacja) złożony z kodów obu kolumn - bez budowania MultiIndexu
+    year_codes, years = pd.factorize(daily["Rok"], sort=True)
+    station_codes, stations = pd.factorize(daily["Kod stacji"], sort=True)
+    codes = np.where(
+        (year_codes >= 0) & (station_codes >= 0), year_codes * len(stations) + station_codes, -1
+    )
+    # porównanie w typie średnich dziennych (float32), jak `daily > threshold` w pandas
+    vals = pd.to_numeric(daily["Daily mean PM25"], errors="coerce").to_numpy()
+    if vals.dtype != np.float32:
+        vals = vals.astype(np.float64)
+    counts = kernel(
+        codes.astype(np.int64), vals, vals.dtype.type(threshold), len(years) * len(stations)
+    )
+
+    # jak w wersji pandas: tylko stacje z przekroczeniami, posortowane po roku i stacji
+    groups = np.flatnonzero(counts)
+    out = pd.DataFrame({
+        "Rok": years.take(groups // len(stations)),
+        "Kod stacji": stations.take(groups % len(stations)),
+        f"Liczba dni PM25 > {threshold}": counts[groups],
+    })
+    out = out.astype({"Rok": daily["Rok"].dtype, "Kod stacji": daily["Kod stacji"].dtype})
     return out
 
 
-def count_overnorm_days(daily, threshold):
+def count_overnorm_days(daily, threshold, engine="pandas"):
     """
     Liczy dni z przekroczeniem dobowej normy PM2.5 dla każdej stacji.
 
     Args:
         daily (pandas.DataFrame): Dzienne średnie stężenia PM2.5.
         threshold (float): Wartość graniczna normy PM2.5.
+        engine (str): "pandas" (domyślnie) lub "numba" - porównanie i zliczanie kernelem JIT.
 
     Returns:
         pandas.DataFrame: Liczba dni z przekroczeniem normy dla każdej stacji i roku.
     """
-    df = daily.copy()
-    over = df[df["Daily mean PM25"] > threshold]
+    if engine == "numba":
+        return _count_daily_overnorm_numba(daily, threshold)
+    if engine != "pandas":
+        raise ValueError(f"Nieznany engine: {engine}")
+
+    over = daily[daily["Daily mean PM25"] > threshold]
 
+    # calc_daily_means daje jeden wiersz na stację i dzień, więc liczba wierszy = liczba dni
     out = (
-        over.groupby(["Rok", "Kod stacji"])["Data"]
-        .nunique()
+        over.groupby(["Rok", "Kod stacji"], observed=True)
+        .size()
+        .reset_index(name=f"Liczba dni PM25 > {threshold}")
+    )
+    return out
+
+
+def _count_overnorm_kernel(codes, years, days, vals, threshold):
+    """
+    Jedno przejście po pomiarach posortowanych po (stacja, dzień): średnia dzienna,
+    porównanie z progiem i zliczanie dni dla każdej pary (stacja, rok).
+
+    Args:
+        codes (numpy.ndarray): Kody stacji (int32).
+        years (numpy.ndarray): Rok pomiaru (int16).
+        days (numpy.ndarray): Numer dnia pomiaru (int64).
+        vals (numpy.ndarray): Wartości PM2.5 (float32 lub float64, NaN = brak pomiaru).
+        threshold (numpy.floating): Wartość graniczna normy PM2.5 w typie `vals`.
+
+    Returns:
+        tuple: Kody stacji, lata i liczby dni z przekroczeniem (tylko niezerowe).
+    """
+    n = len(vals)
+    out_codes = np.empty(n, dtype=np.int32)
+    out_years = np.empty(n, dtype=np.int16)
+    out_counts = np.empty(n, dtype=np.int64)
+    n_out = 0
+    count = 0
+    total = 0.0
+    n_valid = 0
+    # średnia dzienna zapisywana w typie danych wejściowych, jak wynik mean w pandas
+    mean = np.empty(1, dtype=vals.dtype)
+
+    for i in range(n):
+        if not np.isnan(vals[i]):
+            total += vals[i]
+            n_valid += 1
+
+        last = i == n - 1
+        # koniec dnia dla danej stacji
+        if last or codes[i + 1] != codes[i] or days[i + 1] != days[i]:
+            # średnia zaokrąglona do typu danych (float32) i porównana z progiem w tym samym typie,
+            # jak w pandas - inaczej dzień o średniej równej progowi mógłby wyjść powyżej niego
+            if n_valid > 0:
+                mean[0] = total / n_valid
+                if mean[0] > threshold:
+                    count += 1
+            total = 0.0
+            n_valid = 0
+
+            # koniec roku dla danej stacji
+            if last or codes[i + 1] != codes[i] or years[i + 1] != years[i]:
+                if count > 0:
+                    out_codes[n_out] = codes[i]
+                    out_years[n_out] = years[i]
+                    out_counts[n_out] = count
+                    n_out += 1
+                count = 0
+
+    return out_codes[:n_out], out_years[:n_out], out_counts[:n_out]
+
+
+def _count_overnorm_days_numba(formated, threshold):
+    """
+    Wersja count_overnorm_days_fused liczona kernelem numby na tablicach NumPy.
+
+    Args:
+        formated (pandas.DataFrame): Dane PM2.5 w formacie długim.
+        threshold (float): Wartość graniczna normy PM2.5.
+
+    Returns:
+        pandas.DataFrame: Liczba dni z przekroczeniem normy dla każdej stacji i roku.
+    """
+    kernel = _jit(_count_overnorm_kernel)
+
+    stations = formated["Kod stacji"].astype("category")
+    year, _, day = _time_keys(formated)
+
+    codes = stations.cat.codes.to_numpy(np.int32)
+    years = year.to_numpy(np.int16)
+    days = day.to_numpy().astype("datetime64[D]").astype(np.int64)
+    vals = pd.to_numeric(formated["PM25"], errors="coerce").to_numpy()
+    if vals.dtype != np.float32:
+        vals = vals.astype(np.float64)
+
+    # pomijamy brakujące kody stacji (tak jak groupby) i sortujemy po (stacja, dzień),
+    # chyba że dane już są tak ułożone (wynik convert_df)
+    step_codes, step_days = np.diff(codes), np.diff(days)
+    if np.all((step_codes > 0) | ((step_codes == 0) & (step_days >= 0))):
+        order = np.arange(len(codes))
+    else:
+        order = np.lexsort((days, codes))
+    order = order[codes[order] >= 0]
+    out_codes, out_years, out_counts = kernel(
+        codes[order], years[order], days[order], vals[order], vals.dtype.type(threshold)
+    )
+
+    # kernel zwraca wyniki stacja po stacji - kolejność jak w wersji pandas: rok, potem stacja
+    by_year = np.lexsort((out_codes, out_years))
+    out_codes, out_years, out_counts = out_codes[by_year], out_years[by_year], out_counts[by_year]
+
+    out_stations = pd.Series(pd.Categorical.from_codes(out_codes, dtype=stations.dtype))
+    return pd.DataFrame({
+        "Rok": out_years.astype(year.dtype),
+        "Kod stacji": out_stations.astype(formated["Kod stacji"].dtype),
+        f"Liczba dni PM25 > {threshold}": out_counts,
+    })
+
+
+def count_overnorm_days_fused(formated, threshold, engine="pandas"):
+    """
+    Liczy dni z przekroczeniem dobowej normy PM2.5 bezpośrednio z danych godzinowych.
+
+    Odpowiada count_overnorm_days(calc_daily_means(formated), threshold), ale średnie dzienne
+    nie są materializowane jako osobna ramka danych.
+
+    Args:
+        formated (pandas.DataFrame): Dane PM2.5 w formacie długim.
+        threshold (float): Wartość graniczna normy PM2.5.
+        engine (str): "pandas" (domyślnie) lub "numba" - jedno przejście kernelem JIT.
+
+    Returns:
+        pandas.DataFrame: Liczba dni z przekroczeniem normy dla każdej stacji i roku.
+    """
+    if engine == "numba":
+        return _count_overnorm_days_numba(formated, threshold)
+    if engine != "pandas":
+        raise ValueError(f"Nieznany engine: {engine}")
+
+    pm25 = pd.to_numeric(formated["PM25"], errors="coerce")
+    year, _, day = _time_keys(formated)
+
+    # kolejność grup pośrednich bez znaczenia - sortuje dopiero końcowe grupowanie
+    daily = pm25.groupby([year, formated["Kod stacji"], day], observed=True, sort=False).mean()
+    over = daily[daily > threshold]
+
+    out = (
+        over.groupby(level=["Rok", "Kod stacji"], observed=True)
+        .size()
         .reset_index(name=f"Liczba dni PM25 > {threshold}")
     )
     return out
@@ -133,12 +460,15 @@ def top_bottom_stations(over_counts, year, n=3):
     Returns:
         pandas.DataFrame: Zestawienie n stacji z największą i n z najmniejszą liczbą przekroczeń.
     """
-    df = over_counts[over_counts["Rok"] == year].copy()
+    df = over_counts[over_counts["Rok"] == year]
     col = df.columns[-1] # licznik dni
+
+    # nlargest/nsmallest wybierają n skrajnych wierszy bez sortowania całej ramki;
+    # przy remisach na granicy deterministycznie wygrywa wcześniejszy wiersz (keep="first")
     top = df.nlargest(n, col)
     bottom = df.nsmallest(n, col)
-    out = pd.concat([top, bottom], ignore_index=True)
-    return out
+
+    return pd.concat([top, bottom], ignore_index=True)
 
 def wojew_over_treshold(long: pd.DataFrame, wojew_dict: dict, treshold: int = 15):        
     """
@@ -152,23 +482,25 @@ def wojew_over_treshold(long: pd.DataFrame, wojew_dict: dict, treshold: int = 15
     Returns:
         pandas.DataFrame: Zliczenia dni z przekroczeniem normy PM2.5 posortowanej malejąco
     """
-    long['date'] = long["datetime"].dt.date
-    long["Województwo"] = long["Kod stacji"].str[:2]
-    long['Województwo'] = long["Województwo"].apply(lambda code: wojew_dict[code])
-
-    long = long.drop("Miejscowość", axis=1)
-
-    daily  = (
-        long
-        .groupby(["Województwo", "Kod stacji", "date"], as_index=False)
-        .agg(PM25=("PM25", "mean"))
-    )
-    wojew_means = (
-        daily
-        .groupby(['date', "Województwo"], as_index=False)
-        .agg(PM25=("PM25", "mean"))
-    )
-
-    wojew_means['exceeds_treshold'] = wojew_means['PM25'] > treshold
-    counts = wojew_means.groupby('Województwo')['exceeds_treshold'].sum()
+    # województwo wyznaczane raz dla każdej kategorii stacji, a nie dla każdego wiersza
+    stations = long["Kod stacji"].astype("category")
+    wojew = pd.Categorical([wojew_dict[code[:2]] for code in stations.cat.categories])
+    codes = stations.cat.codes.to_numpy()
+    wojew_codes = np.where(codes >= 0, wojew.codes[codes], -1)
+
+    # nowa ramka z potrzebnymi kolumnami - bez modyfikowania `long` (copy-on-write chroni dane wejściowe)
+    df = pd.DataFrame({
+        "Województwo": pd.Categorical.from_codes(wojew_codes, categories=wojew.categories),
+        "Kod stacji": stations,
+        "date": _time_keys(long)[2],
+        "PM25": long["PM25"],
+    }, copy=False)
+
+    # grupowania pośrednie bez sortowania - kolejność ustala dopiero końcowe grupowanie
+    daily = df.groupby(["Województwo", "Kod stacji", "date"], observed=True, sort=False)["PM25"].mean()
+    # drugie grupowanie po poziomach indeksu już zagregowanej (dużo mniejszej) serii
+    wojew_means = daily.groupby(level=["date", "Województwo"], observed=True, sort=False).mean()
+
+    exceeds_treshold = (wojew_means > treshold).rename("exceeds_treshold")
+    counts = exceeds_treshold.groupby(level="Województwo", observed=True).sum()
     return counts.sort_values(ascending=False)
\ No newline at end of file
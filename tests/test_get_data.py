@@ -2,23 +2,26 @@ from unittest.mock import MagicMock, patch, call
 import pandas as pd
 import zipfile
 import pytest
+import requests
 import io
+import pyarrow.parquet as pq
 
 import get_data
 
 
-@pytest.fixture
+@pytest.fixture(scope="module")
 def df_pm25():
-    """Fragment surowych danych PM2.5 z GIOŚ (2015)"""
-    return pd.DataFrame(
+    """Fragment surowych danych PM2.5 z GIOŚ (2015), tylko do odczytu"""
+    return pd.DataFrame.from_records(
         [
-            ["Kod stacji", "DsJelGorOgin", "DsWrocAlWisn", "DsWrocWybCon"],
-            ["Wskaźnik", "PM2.5", "PM2.5", "PM2.5"],
-            ["Czas uśredniania", "1g", "1g", "1g"],
-            ["2015-01-01 01:00:00", 151.112, 78.0, 50.0],
-            ["2015-01-01 02:00:00", 262.566, 42.0, 33.8244],
-            ["2015-01-01 03:00:00", 222.83, 27.0, 28.7215],
-        ]
+            ("Kod stacji", "DsJelGorOgin", "DsWrocAlWisn", "DsWrocWybCon"),
+            ("Wskaźnik", "PM2.5", "PM2.5", "PM2.5"),
+            ("Czas uśredniania", "1g", "1g", "1g"),
+            ("2015-01-01 01:00:00", 151.112, 78.0, 50.0),
+            ("2015-01-01 02:00:00", 262.566, 42.0, 33.8244),
+            ("2015-01-01 03:00:00", 222.83, 27.0, 28.7215),
+        ],
+        columns=range(4),
     )
 
 
@@ -35,7 +38,7 @@ def zip_pm25_bytes():
 def test_download_gios_archive(zip_pm25_bytes, df_pm25):
     """
     Sprawdza, czy funkcja download_gios_archive:
-    - pobiera ZIP z właściwego URL,
+    - pobiera ZIP z właściwego URL (strumieniowo) i zamyka połączenie,
     - otwiera plik wewnątrz archiwum,
     - wywołuje pd.read_excel z header=None i zwraca DataFrame
     """
@@ -48,22 +51,82 @@ def test_download_gios_archive(zip_pm25_bytes, df_pm25):
     with patch("get_data.requests.get") as mock_get, patch(
         "get_data.pd.read_excel"
     ) as mock_xl:
-        mock_get.return_value = MagicMock()
-        mock_get.return_value.raise_for_status.return_value = None
-        mock_get.return_value.content = zip_bytes
+        response = MagicMock()
+        response.raise_for_status.return_value = None
+        response.iter_content.return_value = [zip_bytes]
+        mock_get.return_value.__enter__.return_value = response
         mock_xl.return_value = expected
 
         out = get_data.download_gios_archive(year, gios_id, filename)
-        mock_get.assert_called_once_with(f"{get_data.gios_archive_url}{gios_id}")
+        mock_get.assert_called_once_with(
+            f"{get_data.gios_archive_url}{gios_id}", stream=True
+        )
+        mock_get.return_value.__exit__.assert_called_once()
 
         mock_xl.assert_called_once()
         (arg0,), kwargs = mock_xl.call_args
         assert hasattr(arg0, "read")
         assert kwargs.get("header") is None
+        assert kwargs.get("engine") == "calamine"
 
         pd.testing.assert_frame_equal(out, expected)
 
 
+def test_download_gios_archive_http_error():
+    """
+    Sprawdza, czy download_gios_archive przy błędzie HTTP przekazuje wyjątek
+    i zamyka połączenie
+    """
+
+    with patch("get_data.requests.get") as mock_get:
+        response = MagicMock()
+        response.raise_for_status.side_effect = requests.HTTPError("404")
+        mock_get.return_value.__enter__.return_value = response
+
+        with pytest.raises(requests.HTTPError):
+            get_data.download_gios_archive(2015, "236", "2015_PM25_1g.xlsx")
+
+        mock_get.return_value.__exit__.assert_called_once()
+        response.iter_content.assert_not_called()
+
+
+def test_cached_gios_archive(tmp_path, df_pm25):
+    """
+    Sprawdza, czy funkcja cached_gios_archive:
+    - przy pierwszym wywołaniu pobiera dane i zapisuje je w katalogu cache,
+    - przy kolejnym wywołaniu wczytuje dane z dysku bez ponownego pobierania
+    """
+
+    with patch("get_data.download_gios_archive", return_value=df_pm25) as mock_download:
+        first = get_data.cached_gios_archive(2015, "236", "2015_PM25_1g.xlsx", tmp_path)
+        second = get_data.cached_gios_archive(2015, "236", "2015_PM25_1g.xlsx", tmp_path)
+
+        mock_download.assert_called_once_with(2015, "236", "2015_PM25_1g.xlsx")
+        assert len(list(tmp_path.iterdir())) == 1
+        pd.testing.assert_frame_equal(first, df_pm25)
+        pd.testing.assert_frame_equal(second, df_pm25)
+
+
+def test_cached_gios_archive_interrupted_write(tmp_path, df_pm25):
+    """
+    Sprawdza, czy cached_gios_archive po przerwanym zapisie do cache
+    nie zostawia pliku w katalogu i przy kolejnym wywołaniu pobiera dane ponownie
+    """
+
+    with patch("get_data.download_gios_archive", return_value=df_pm25) as mock_download:
+        with patch("pandas.DataFrame.to_pickle", side_effect=KeyboardInterrupt):
+            with pytest.raises(KeyboardInterrupt):
+                get_data.cached_gios_archive(2015, "236", "2015_PM25_1g.xlsx", tmp_path)
+
+        assert list(tmp_path.iterdir()) == []
+
+        out = get_data.cached_gios_archive(2015, "236", "2015_PM25_1g.xlsx", tmp_path)
+
+        assert mock_download.call_count == 2
+        assert [p.suffix for p in tmp_path.iterdir()] == [".pkl"]
+        pd.testing.assert_frame_equal(out, df_pm25)
+
+
 def test_download_gios_meta():
     """
     Sprawdza, czy funkcja download_gios_meta:
@@ -102,8 +165,9 @@ def test_download_gios_meta():
         mock_get.assert_called_once_with(f"{get_data.gios_archive_url}{gios_id}")
 
         mock_xl.assert_called_once()
-        (arg0,), _ = mock_xl.call_args
+        (arg0,), kwargs = mock_xl.call_args
         assert isinstance(arg0, io.BytesIO)
+        assert kwargs.get("engine") == "calamine"
         assert arg0.getvalue() == fake_bytes
 
         pd.testing.assert_frame_equal(out, expected)
@@ -114,7 +178,7 @@ def test_clean_pm25(df_pm25):
     Sprawdza, czy funkcja clean_pm25:
     - ustawia nagłówki z wybranego wiersza,
     - usuwa wskazane wiersze,
-    - zwraca kolumnę datetime oraz dane stacji,
+    - zwraca kolumnę datetime oraz dane stacji (liczbowe jako float32),
     - nie modyfikuje wejściowego DataFrame
     """
     df_raw = df_pm25.copy(deep=True)
@@ -125,7 +189,8 @@ def test_clean_pm25(df_pm25):
     expected = pd.DataFrame(
         {
             "datetime": pd.to_datetime(
-                ["2015-01-01 01:00:00", "2015-01-01 02:00:00", "2015-01-01 03:00:00"]
+                ["2015-01-01 01:00:00", "2015-01-01 02:00:00", "2015-01-01 03:00:00"],
+                format="ISO8601",
             ),
             "DsJelGorOgin": [151.112, 262.566, 222.83],
             "DsWrocAlWisn": [78.0, 42.0, 27.0],
@@ -134,6 +199,7 @@ def test_clean_pm25(df_pm25):
     )
 
     pd.testing.assert_frame_equal(out, expected, check_dtype=False, check_names=False)
+    assert (out.dtypes.iloc[1:] == "float32").all()
     pd.testing.assert_frame_equal(
         df_raw, df_raw_copy, check_dtype=False, check_names=False
     )
@@ -152,7 +218,8 @@ def test_midnight():
                     "2015-01-01 23:00:00.105",
                     "2015-01-02 00:00:00.110",
                     "2015-01-02 01:00:00.115",
-                ]
+                ],
+                format="ISO8601",
             ),
             "DsJelGorOgin": [151.112, 262.566, 222.83],
             "DsWrocAlWisn": [78.0, 42.0, 27.0],
@@ -170,7 +237,8 @@ def test_midnight():
                     "2015-01-01 23:00:00.105",
                     "2015-01-01 23:59:59.110",
                     "2015-01-02 01:00:00.115",
-                ]
+                ],
+                format="ISO8601",
             ),
             "DsJelGorOgin": [151.112, 262.566, 222.83],
             "DsWrocAlWisn": [78.0, 42.0, 27.0],
@@ -193,7 +261,7 @@ def test_update_stations():
 
     df = pd.DataFrame(
         {
-            "datetime": pd.to_datetime(["2015-01-01 01:00:00"]),
+            "datetime": pd.to_datetime(["2015-01-01 01:00:00"], format="ISO8601"),
             "PdBialWaszyn": [67.0],
             "ZpSzczPils02": [None],
         }
@@ -229,7 +297,7 @@ def test_add_city():
     """
     df = pd.DataFrame(
         {
-            "datetime": pd.to_datetime(["2015-01-01 01:00:00", "2015-01-01 02:00:00"]),
+            "datetime": pd.to_datetime(["2015-01-01 01:00:00", "2015-01-01 02:00:00"], format="ISO8601"),
             "DsJelGorOgin": [151.112, 262.566],
             "DsWrocAlWisn": [78.0, 42.0],
             "DsWrocWybCon": [50.0, 33.8244],
@@ -266,7 +334,7 @@ def test_make_pm25_data(mocker):
     Sprawdza, czy make_pm25_data:
     - wykonuje cały pipeline (download, clean, midnight, update, add_city),
     - zwraca końcowy DataFrame i metadane,
-    - zapisuje wynik do pliku CSV z podaną nazwą pliku.
+    - zapisuje wynik (save_pm25) do pliku z podaną nazwą pliku.
     """
 
     years = [2015]
@@ -305,7 +373,8 @@ def test_make_pm25_data(mocker):
                     "2015-01-01 23:00:00.105",
                     "2015-01-02 00:00:00.110",
                     "2015-01-02 01:00:00.115",
-                ]
+                ],
+                format="ISO8601",
             ),
             "DsJelGorOgin": [151.112, 262.566, 222.83],
             "DsWrocAlWisn": [78.0, 42.0, 27.0],
@@ -320,7 +389,8 @@ def test_make_pm25_data(mocker):
                     "2015-01-01 23:00:00.105",
                     "2015-01-01 23:59:59.110",
                     "2015-01-02 01:00:00.115",
-                ]
+                ],
+                format="ISO8601",
             ),
             "DsJelGorOgin": [151.112, 262.566, 222.83],
             "DsWrocAlWisn": [78.0, 42.0, 27.0],
@@ -359,7 +429,7 @@ def test_make_pm25_data(mocker):
     mock_update = mocker.patch("get_data.update_stations", return_value=updated_df)
     mock_add_city = mocker.patch("get_data.add_city", return_value=final_df)
 
-    mock_to_csv = mocker.patch("pandas.DataFrame.to_csv", autospec=True)
+    mock_save = mocker.patch("get_data.save_pm25")
 
     out_df, out_meta = get_data.make_pm25_data(
         years, gios_url_ids, gios_pm25_file, clean_info, outfile
@@ -389,7 +459,71 @@ def test_make_pm25_data(mocker):
     pd.testing.assert_frame_equal(args0, updated_df)
     pd.testing.assert_frame_equal(args1, meta_df)
 
-    mock_to_csv.assert_called_once()
-    assert mock_to_csv.call_args.args[0] is final_df
-    assert mock_to_csv.call_args.args[1] == outfile
-    assert mock_to_csv.call_args.kwargs.get("index") is None
+    mock_save.assert_called_once()
+    assert mock_save.call_args.args[0] is final_df
+    assert mock_save.call_args.args[1] == outfile
+
+
+def test_save_pm25_csv(tmp_path):
+    """
+    Sprawdza, czy save_pm25 dla pliku .csv:
+    - zapisuje dwa wiersze nagłówka (miejscowość, kod stacji),
+    - używa końców linii "\\n" w całym pliku (nagłówek i dane),
+    - zapisuje dane, które po wczytaniu są zgodne z wejściowym DataFrame
+    """
+    df = pd.DataFrame(
+        {
+            ("datetime", ""): pd.to_datetime(["2015-01-01 01:00:00", "2015-01-01 02:00:00"], format="ISO8601"),
+            ("Jelenia Góra", "DsJelGorOgin"): [151.112, None],
+            ("Wrocław", "DsWrocAlWisn"): [78.0, 42.0],
+        }
+    )
+    df.columns.names = ["Miejscowość", "Kod stacji"]
+    outfile = tmp_path / "PM25_test.csv"
+
+    get_data.save_pm25(df, outfile)
+
+    raw = outfile.read_bytes()
+    assert b"\r" not in raw
+    assert raw.decode("utf-8").startswith(
+        "datetime,Jelenia Góra,Wrocław\n,DsJelGorOgin,DsWrocAlWisn\n2015-01-01 01:00:00"
+    )
+
+    out = pd.read_csv(outfile, header=[0, 1])
+    assert (pd.to_datetime(out.iloc[:, 0], format="ISO8601") == df.iloc[:, 0]).all()
+    pd.testing.assert_frame_equal(
+        out.iloc[:, 1:], df.iloc[:, 1:], check_dtype=False, check_names=False
+    )
+
+
+def test_save_pm25_parquet(tmp_path):
+    """
+    Sprawdza, czy save_pm25 dla pliku .parquet:
+    - zapisuje plik Parquet (kompresja zstd) zamiast CSV,
+    - zachowuje kolumny w formacie MultiIndex (Miejscowość, Kod stacji),
+    - zapisuje kolumny z wartościami mieszanego typu jako tekst,
+    - zachowuje kolumny liczbowe (również float32 i brakujące wartości)
+    """
+    df = pd.DataFrame(
+        {
+            ("datetime", ""): pd.to_datetime(["2015-01-01 01:00:00", "2015-01-01 02:00:00"], format="ISO8601"),
+            ("Jelenia Góra", "DsJelGorOgin"): pd.array([151.112, "26,5"], dtype=object),
+            ("Wrocław", "DsWrocAlWisn"): [78.0, None],
+            ("Wrocław", "DsWrocWybCon"): pd.array([50.0, 33.8244], dtype="float32"),
+        }
+    )
+    df.columns.names = ["Miejscowość", "Kod stacji"]
+    outfile = tmp_path / "PM25_test.parquet"
+
+    get_data.save_pm25(df, outfile)
+
+    meta = pq.ParquetFile(outfile).metadata
+    assert meta.row_group(0).column(0).compression == "ZSTD"
+
+    out = pd.read_parquet(outfile)
+
+    pd.testing.assert_index_equal(out.columns, df.columns)
+    pd.testing.assert_series_equal(out[("datetime", "")], df[("datetime", "")])
+    assert out[("Jelenia Góra", "DsJelGorOgin")].tolist() == ["151.112", "26,5"]
+    pd.testing.assert_series_equal(out[("Wrocław", "DsWrocAlWisn")], df[("Wrocław", "DsWrocAlWisn")])
+    pd.testing.assert_series_equal(out[("Wrocław", "DsWrocWybCon")], df[("Wrocław", "DsWrocWybCon")])
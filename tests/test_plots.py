@@ -0,0 +1,53 @@
+import os
+
+import pandas as pd
+import pytest
+
+# backend Agg - testy tworzą figury bez GUI
+os.environ["PM25_HEADLESS"] = "1"
+
+import matplotlib.pyplot as plt
+
+from plots import heatmaps_means
+
+
+@pytest.fixture(scope="module")
+def city_monthly():
+    """Średnie miesięczne PM2.5 dla miejscowości, tylko do odczytu"""
+    return pd.DataFrame.from_records(
+        [
+            (2015, 1, "Jelenia Góra", 206.839),
+            (2015, 2, "Jelenia Góra", 120.5),
+            (2015, 1, "Wrocław", 50.9561),
+        ],
+        columns=["Rok", "Miesiąc", "Miejscowość", "Mean PM25"],
+    )
+
+
+def test_heatmaps_means(city_monthly):
+    """
+    Sprawdza, czy heatmaps_means:
+    - rysuje heatmapę dla każdej miejscowości,
+    - dodaje jeden wspólny colorbar,
+    - wyłącza niewykorzystane osie siatki
+    """
+    fig = heatmaps_means(city_monthly, [2015])
+
+    titles = [ax.get_title() for ax in fig.axes if ax.axison and ax.get_title()]
+    assert titles == ["Jelenia Góra", "Wrocław"]
+    # 18 osi siatki + oś colorbara
+    assert len(fig.axes) == 19
+    assert fig.axes[-1].get_ylabel() == "PM2.5 [ug/m3]"
+    plt.close(fig)
+
+
+def test_heatmaps_means_no_data(city_monthly):
+    """
+    Sprawdza, czy heatmaps_means dla lat bez danych zwraca pustą figurę
+    (bez colorbara i bez błędu)
+    """
+    fig = heatmaps_means(city_monthly, [1999])
+
+    assert len(fig.axes) == 18
+    assert not any(ax.axison for ax in fig.axes)
+    plt.close(fig)
@@ -5,16 +5,19 @@ from stats import (
     convert_df,
     calc_monthly_means,
     calc_monthly_city_means,
+    calc_monthly_means_and_city,
     calc_daily_means,
     count_overnorm_days,
+    count_overnorm_days_fused,
     top_bottom_stations,
+    wojew_over_treshold,
 )
 
 
-@pytest.fixture
+@pytest.fixture(scope="module")
 def df_pm25():
     """
-    Uporządkowane dane PM2.5
+    Uporządkowane dane PM2.5, tylko do odczytu
     """
     cols = pd.MultiIndex.from_tuples(
         [
@@ -26,104 +29,56 @@ def df_pm25():
         names=["Miejscowość", "Kod stacji"],
     )
 
-    df_in = pd.DataFrame(
-        [
-            ["2015-01-01 01:00:00.000", 151.112, 78.00, 50.00],
-        ],
+    df_in = pd.DataFrame.from_records(
+        [("2015-01-01 01:00:00.000", 151.112, 78.00, 50.00)],
         columns=cols,
     )
-    df_in[("datetime", "")] = pd.to_datetime(df_in[("datetime", "")])
+    df_in[("datetime", "")] = pd.to_datetime(df_in[("datetime", "")], format="ISO8601")
     return df_in
 
 
-@pytest.fixture
+@pytest.fixture(scope="module")
 def df_pm25_formated():
     """
-    Uporządkowane dane PM2.5, ale w innym formacie
+    Uporządkowane dane PM2.5, ale w innym formacie, tylko do odczytu
     """
-    df = pd.DataFrame(
+    df = pd.DataFrame.from_records(
         [
-            {
-                "datetime": "2015-01-01 01:00:00",
-                "Miejscowość": "Jelenia Góra",
-                "Kod stacji": "DsJelGorOgin",
-                "PM25": 151.112,
-            },
-            {
-                "datetime": "2015-01-01 01:00:00",
-                "Miejscowość": "Wrocław",
-                "Kod stacji": "DsWrocAlWisn",
-                "PM25": 78.0,
-            },
-            {
-                "datetime": "2015-01-01 01:00:00",
-                "Miejscowość": "Wrocław",
-                "Kod stacji": "DsWrocWybCon",
-                "PM25": 50.0,
-            },
-            {
-                "datetime": "2015-01-01 02:00:00",
-                "Miejscowość": "Jelenia Góra",
-                "Kod stacji": "DsJelGorOgin",
-                "PM25": 262.566,
-            },
-            {
-                "datetime": "2015-01-01 02:00:00",
-                "Miejscowość": "Wrocław",
-                "Kod stacji": "DsWrocAlWisn",
-                "PM25": 42.0,
-            },
-            {
-                "datetime": "2015-01-01 02:00:00",
-                "Miejscowość": "Wrocław",
-                "Kod stacji": "DsWrocWybCon",
-                "PM25": 33.8244,
-            },
-        ]
+            ("2015-01-01 01:00:00", "Jelenia Góra", "DsJelGorOgin", 151.112),
+            ("2015-01-01 01:00:00", "Wrocław", "DsWrocAlWisn", 78.0),
+            ("2015-01-01 01:00:00", "Wrocław", "DsWrocWybCon", 50.0),
+            ("2015-01-01 02:00:00", "Jelenia Góra", "DsJelGorOgin", 262.566),
+            ("2015-01-01 02:00:00", "Wrocław", "DsWrocAlWisn", 42.0),
+            ("2015-01-01 02:00:00", "Wrocław", "DsWrocWybCon", 33.8244),
+        ],
+        columns=["datetime", "Miejscowość", "Kod stacji", "PM25"],
     )
-    df["datetime"] = pd.to_datetime(df["datetime"])
+    df["datetime"] = pd.to_datetime(df["datetime"], format="ISO8601")
     return df
 
 
-@pytest.fixture
+@pytest.fixture(scope="module")
 def df_monthly_means():
     """
-    Średnie miesięczne wartości PM2.5 dla stacji
+    Średnie miesięczne wartości PM2.5 dla stacji, tylko do odczytu
     """
-    return pd.DataFrame(
+    return pd.DataFrame.from_records(
         [
-            {
-                "Rok": 2015,
-                "Miesiąc": 1,
-                "Miejscowość": "Jelenia Góra",
-                "Kod stacji": "DsJelGorOgin",
-                "Mean PM25": (151.112 + 262.566) / 2,
-            },
-            {
-                "Rok": 2015,
-                "Miesiąc": 1,
-                "Miejscowość": "Wrocław",
-                "Kod stacji": "DsWrocAlWisn",
-                "Mean PM25": (78.0 + 42.0) / 2,
-            },
-            {
-                "Rok": 2015,
-                "Miesiąc": 1,
-                "Miejscowość": "Wrocław",
-                "Kod stacji": "DsWrocWybCon",
-                "Mean PM25": (50.0 + 33.8244) / 2,
-            },
-        ]
+            (2015, 1, "Jelenia Góra", "DsJelGorOgin", (151.112 + 262.566) / 2),
+            (2015, 1, "Wrocław", "DsWrocAlWisn", (78.0 + 42.0) / 2),
+            (2015, 1, "Wrocław", "DsWrocWybCon", (50.0 + 33.8244) / 2),
+        ],
+        columns=["Rok", "Miesiąc", "Miejscowość", "Kod stacji", "Mean PM25"],
     )
 
 
-
 def test_convert_df(df_pm25):
     """
     Sprawdza, czy funkcja convert_df:
     - zamienia format danych,
     - zachowuje poprawne wartości PM25,
-    - tworzy kolumny datetime, Miejscowość i Kod stacji
+    - tworzy kolumny datetime, Miejscowość i Kod stacji (typu category),
+    - dodaje kolumny Rok, Miesiąc i Dzień
     """
     out = convert_df(df_pm25)
 
@@ -149,9 +104,15 @@ def test_convert_df(df_pm25):
             },
         ]
     )
-    expected["datetime"] = pd.to_datetime(expected["datetime"])
-
-    # sortowanie usuwa zależność od kolejności po stack()
+    expected["datetime"] = pd.to_datetime(expected["datetime"], format="ISO8601")
+    expected["PM25"] = expected["PM25"].astype("float32")
+    expected["Miejscowość"] = expected["Miejscowość"].astype("category")
+    expected["Kod stacji"] = expected["Kod stacji"].astype("category")
+    expected["Rok"] = pd.Series([2015] * 3, dtype="int16")
+    expected["Miesiąc"] = pd.Series([1] * 3, dtype="int8")
+    expected["Dzień"] = expected["datetime"].dt.floor("D")
+
+    # sortowanie usuwa zależność od kolejności po przekształceniu
     out = out.sort_values(["Miejscowość", "Kod stacji"]).reset_index(drop=True)
     expected = expected.sort_values(["Miejscowość", "Kod stacji"]).reset_index(
         drop=True
@@ -176,6 +137,23 @@ def test_convert_df_cleans_strings(df_pm25):
     assert val == pytest.approx(151.112)
 
 
+def test_convert_df_invalid_strings(df_pm25):
+    """
+    Sprawdza, czy funkcja convert_df zamienia wpisy, które nie są liczbami, na NaN
+    i poprawnie konwertuje pozostałe wartości tekstowe
+    """
+    df = df_pm25.copy()
+    df[("Jelenia Góra", "DsJelGorOgin")] = " 151,112 "
+    df[("Wrocław", "DsWrocAlWisn")] = "brak"
+    df[("Wrocław", "DsWrocWybCon")] = " "
+
+    out = convert_df(df).set_index("Kod stacji")["PM25"]
+
+    assert out["DsJelGorOgin"] == pytest.approx(151.112)
+    assert pd.isna(out["DsWrocAlWisn"])
+    assert pd.isna(out["DsWrocWybCon"])
+
+
 def test_calc_monthly_means(df_pm25_formated):
     """
     Sprawdza, czy funkcja calc_monthly_means:
@@ -223,6 +201,26 @@ def test_calc_monthly_means(df_pm25_formated):
     )
 
 
+def test_calc_monthly_means_observed_only(df_pm25_formated):
+    """
+    Sprawdza, czy funkcje grupujące po kolumnach typu category:
+    - zwracają tylko występujące w danych kombinacje miejscowości i stacji,
+    - nie tworzą wierszy dla nieużywanych kategorii
+    """
+    df = df_pm25_formated.copy()
+    df["Miejscowość"] = df["Miejscowość"].astype("category")
+    df["Kod stacji"] = df["Kod stacji"].astype("category").cat.add_categories(["KpBydPlPozna"])
+
+    monthly = calc_monthly_means(df)
+    daily = calc_daily_means(df)
+    city = calc_monthly_city_means(monthly)
+
+    pairs = {("Jelenia Góra", "DsJelGorOgin"), ("Wrocław", "DsWrocAlWisn"), ("Wrocław", "DsWrocWybCon")}
+    assert set(zip(monthly["Miejscowość"], monthly["Kod stacji"])) == pairs
+    assert set(zip(daily["Miejscowość"], daily["Kod stacji"])) == pairs
+    assert len(city) == 2
+
+
 def test_calc_monthly_city_means(df_monthly_means):
     """
     Sprawdza, czy calc_monthly_city_means:
@@ -260,6 +258,19 @@ def test_calc_monthly_city_means(df_monthly_means):
     )
 
 
+def test_calc_monthly_means_and_city(df_pm25_formated):
+    """
+    Sprawdza, czy calc_monthly_means_and_city zwraca te same wyniki
+    co kolejne wywołania calc_monthly_means i calc_monthly_city_means
+    """
+
+    monthly, city = calc_monthly_means_and_city(df_pm25_formated)
+
+    expected_monthly = calc_monthly_means(df_pm25_formated)
+    pd.testing.assert_frame_equal(monthly, expected_monthly)
+    pd.testing.assert_frame_equal(city, calc_monthly_city_means(expected_monthly))
+
+
 def test_calc_daily_means(df_pm25_formated):
     """
     Sprawdza, czy funkcja calc_daily_means:
@@ -361,7 +372,7 @@ def test_count_overnorm_days():
             },
         ]
     )
-    daily["Data"] = pd.to_datetime(daily["Data"]).dt.date
+    daily["Data"] = pd.to_datetime(daily["Data"], format="ISO8601").dt.date
 
     threshold = 15
 
@@ -411,7 +422,7 @@ def test_count_overnorm_empty():
             },
         ]
     )
-    daily["Data"] = pd.to_datetime(daily["Data"]).dt.date
+    daily["Data"] = pd.to_datetime(daily["Data"], format="ISO8601").dt.date
 
     out = count_overnorm_days(daily, threshold=15)
 
@@ -419,6 +430,140 @@ def test_count_overnorm_empty():
     assert list(out.columns) == ["Rok", "Kod stacji", "Liczba dni PM25 > 15"]
 
 
+def test_count_overnorm_days_numba(df_pm25_formated):
+    """
+    Sprawdza, czy count_overnorm_days z engine="numba":
+    - daje ten sam wynik co engine="pandas",
+    - zwraca pusty DataFrame, gdy nie występują przekroczenia normy
+    """
+    pytest.importorskip("numba")
+
+    daily = calc_daily_means(df_pm25_formated)
+
+    out = count_overnorm_days(daily, 50, engine="numba")
+    expected = count_overnorm_days(daily, 50, engine="pandas")
+
+    pd.testing.assert_frame_equal(out, expected)
+    assert count_overnorm_days(daily, 1000, engine="numba").empty
+
+
+def test_count_overnorm_days_numba_fractional_threshold(df_pm25_formated):
+    """
+    Sprawdza, czy count_overnorm_days z engine="numba" porównuje średnie dzienne float32
+    z progiem niecałkowitym (15.05) w typie float32, tak jak engine="pandas"
+    """
+    pytest.importorskip("numba")
+
+    # średnie dzienne: DsJelGorOgin float32(15.05) - równa progowi po zaokrągleniu do float32,
+    # DsWrocAlWisn 15.1 (powyżej), DsWrocWybCon 15.0 (poniżej)
+    daily = calc_daily_means(
+        df_pm25_formated.assign(PM25=[15.05, 15.1, 15.0, 15.05, 15.1, 15.0])
+    )
+
+    out = count_overnorm_days(daily, 15.05, engine="numba")
+    expected = count_overnorm_days(daily, 15.05, engine="pandas")
+
+    pd.testing.assert_frame_equal(out, expected)
+    assert out["Kod stacji"].tolist() == ["DsWrocAlWisn"]
+
+
+def test_count_overnorm_days_fused(df_pm25_formated):
+    """
+    Sprawdza, czy funkcja count_overnorm_days_fused:
+    - liczy dni przekroczeń normy bezpośrednio z danych godzinowych,
+    - daje ten sam wynik co calc_daily_means + count_overnorm_days
+    """
+    threshold = 50
+
+    out = count_overnorm_days_fused(df_pm25_formated, threshold)
+
+    expected = pd.DataFrame(
+        [
+            {"Rok": 2015, "Kod stacji": "DsJelGorOgin", "Liczba dni PM25 > 50": 1},
+            {"Rok": 2015, "Kod stacji": "DsWrocAlWisn", "Liczba dni PM25 > 50": 1},
+        ]
+    )
+    two_step = count_overnorm_days(calc_daily_means(df_pm25_formated), threshold)
+
+    out = out.sort_values(["Rok", "Kod stacji"]).reset_index(drop=True)
+    two_step = two_step.sort_values(["Rok", "Kod stacji"]).reset_index(drop=True)
+
+    pd.testing.assert_frame_equal(out, expected, check_dtype=False)
+    pd.testing.assert_frame_equal(out, two_step)
+
+
+def test_count_overnorm_days_fused_numba(df_pm25_formated):
+    """
+    Sprawdza, czy count_overnorm_days_fused z engine="numba":
+    - pomija brakujące pomiary przy liczeniu średnich dziennych,
+    - daje ten sam wynik co engine="pandas", w tej samej kolejności (rok, potem stacja)
+    """
+    pytest.importorskip("numba")
+
+    one_year = pd.concat(
+        [
+            df_pm25_formated,
+            df_pm25_formated.assign(
+                datetime=df_pm25_formated["datetime"] + pd.Timedelta(days=1),
+                PM25=[10.0, float("nan"), 60.0, 10.0, 55.0, 70.0],
+            ),
+        ],
+        ignore_index=True,
+    )
+    # dwa lata - wynik numby nie może być ułożony stacja po stacji
+    df = pd.concat(
+        [one_year, one_year.assign(datetime=one_year["datetime"] + pd.DateOffset(years=3))],
+        ignore_index=True,
+    )
+
+    out = count_overnorm_days_fused(df, 50, engine="numba")
+    expected = count_overnorm_days_fused(df, 50, engine="pandas")
+
+    pd.testing.assert_frame_equal(out, expected)
+    assert out["Rok"].tolist() == [2015, 2015, 2015, 2018, 2018, 2018]
+    assert out["Liczba dni PM25 > 50"].tolist() == [1, 2, 1, 1, 2, 1]
+
+
+def test_count_overnorm_days_fused_numba_at_threshold(df_pm25_formated):
+    """
+    Sprawdza, czy count_overnorm_days_fused z engine="numba" nie liczy dnia,
+    którego średnia z wartości float32 jest dokładnie równa progowi (jak engine="pandas")
+    """
+    pytest.importorskip("numba")
+
+    # średnie dzienne: DsJelGorOgin (8.3 + 21.7) / 2 = 15.0, DsWrocAlWisn 15.05, DsWrocWybCon 15.0
+    df = df_pm25_formated.assign(
+        PM25=pd.Series([8.3, 8.3, 30.0, 21.7, 21.8, 0.0], dtype="float32")
+    )
+
+    out = count_overnorm_days_fused(df, 15.0, engine="numba")
+    expected = count_overnorm_days_fused(df, 15.0, engine="pandas")
+
+    pd.testing.assert_frame_equal(out, expected)
+    assert out["Kod stacji"].tolist() == ["DsWrocAlWisn"]
+    assert out["Liczba dni PM25 > 15.0"].tolist() == [1]
+
+
+def test_count_overnorm_days_fused_numba_fractional_threshold(df_pm25_formated):
+    """
+    Sprawdza, czy count_overnorm_days_fused z engine="numba" porównuje średnie float32
+    z progiem niecałkowitym (15.05) w typie float32, tak jak engine="pandas"
+    """
+    pytest.importorskip("numba")
+
+    # średnie dzienne: DsJelGorOgin float32(15.05) - równa progowi po zaokrągleniu do float32,
+    # DsWrocAlWisn 15.1 (powyżej), DsWrocWybCon 15.0 (poniżej)
+    df = df_pm25_formated.assign(
+        PM25=pd.Series([15.05, 15.1, 15.0, 15.05, 15.1, 15.0], dtype="float32")
+    )
+
+    out = count_overnorm_days_fused(df, 15.05, engine="numba")
+    expected = count_overnorm_days_fused(df, 15.05, engine="pandas")
+
+    pd.testing.assert_frame_equal(out, expected)
+    assert out["Kod stacji"].tolist() == ["DsWrocAlWisn"]
+
+
 def test_top_bottom_stations():
     """
     Sprawdza, czy top_bottom_stations:
@@ -453,3 +598,71 @@ def test_top_bottom_stations():
     expected = expected.sort_values("Kod stacji").reset_index(drop=True)
 
     pd.testing.assert_frame_equal(out, expected)
+
+
+def test_top_bottom_stations_few_stations():
+    """
+    Sprawdza, czy top_bottom_stations:
+    - przy n większym niż liczba stacji zwraca wszystkie stacje w obu grupach,
+    - porządkuje grupy malejąco (największe) i rosnąco (najmniejsze)
+    """
+    over_counts = pd.DataFrame(
+        [
+            {"Rok": 2015, "Kod stacji": "DsJelGorOgin", "Liczba dni PM25 > 15": 10},
+            {"Rok": 2015, "Kod stacji": "DsWrocAlWisn", "Liczba dni PM25 > 15": 80},
+        ]
+    )
+
+    out = top_bottom_stations(over_counts, year=2015, n=3)
+
+    assert out["Liczba dni PM25 > 15"].tolist() == [80, 10, 10, 80]
+    assert top_bottom_stations(over_counts, year=2024, n=3).empty
+
+
+def test_top_bottom_stations_ties():
+    """
+    Sprawdza, czy top_bottom_stations przy remisach na granicy wybiera
+    stacje w kolejności ich wystąpienia w danych
+    """
+    over_counts = pd.DataFrame(
+        [
+            {"Rok": 2015, "Kod stacji": f"Stacja{i}", "Liczba dni PM25 > 15": 5}
+            for i in range(10)
+        ]
+    )
+
+    out = top_bottom_stations(over_counts, year=2015, n=2)
+
+    assert out["Kod stacji"].tolist() == ["Stacja0", "Stacja1", "Stacja0", "Stacja1"]
+
+
+def test_wojew_over_treshold():
+    """
+    Sprawdza, czy funkcja wojew_over_treshold:
+    - uśrednia pomiary najpierw w obrębie stacji, a potem województwa,
+    - liczy dni z przekroczeniem progu dla każdego województwa,
+    - nie modyfikuje wejściowego DataFrame
+    """
+    long = pd.DataFrame(
+        [
+            ("2024-01-01 01:00:00", "Warszawa", "MzWarA", 10.0),
+            ("2024-01-01 02:00:00", "Warszawa", "MzWarA", 30.0),
+            ("2024-01-01 01:00:00", "Warszawa", "MzWarB", 10.0),
+            ("2024-01-01 01:00:00", "Katowice", "SlKatC", 40.0),
+            ("2024-01-02 01:00:00", "Warszawa", "MzWarA", 20.0),
+            ("2024-01-02 01:00:00", "Warszawa", "MzWarB", 20.0),
+            ("2024-01-02 01:00:00", "Katowice", "SlKatC", 5.0),
+            ("2024-01-03 01:00:00", "Katowice", "SlKatC", 16.0),
+        ],
+        columns=["datetime", "Miejscowość", "Kod stacji", "PM25"],
+    )
+    long["datetime"] = pd.to_datetime(long["datetime"], format="ISO8601")
+    long_copy = long.copy(deep=True)
+
+    wojew_dict = {"Mz": "mazowieckie", "Sl": "śląskie"}
+
+    out = wojew_over_treshold(long, wojew_dict, treshold=15)
+
+    assert out.to_dict() == {"śląskie": 2, "mazowieckie": 1}
+    assert list(out.index) == ["śląskie", "mazowieckie"]
+    pd.testing.assert_frame_equal(long, long_copy)